@@ -120,19 +120,20 @@ def my_lucas_kanade_step(I1: np.ndarray,
     # Calculate ATA and b using vectorized operations
     ATA_11 = np.sum(Ixx_windows, axis=(2, 3))
     ATA_12 = np.sum(Ixy_windows, axis=(2, 3))
-    ATA_21 = ATA_12
     ATA_22 = np.sum(Iyy_windows, axis=(2, 3))
-    ATA = np.stack([np.stack([ATA_11, ATA_12], axis=-1), np.stack([ATA_21, ATA_22], axis=-1)], axis=-2)
-    det_ATA = np.linalg.det(ATA)
-    b_1 = np.sum(Ixt_windows, axis=(2, 3))[:, :, np.newaxis]
-    b_2 = np.sum(Iyt_windows, axis=(2, 3))[:, :, np.newaxis]
-    b = np.concatenate([b_1, b_2], axis=-1)
-
-    # Calculate U_V_LS using vectorized operations
-    valid_indices = np.where(det_ATA > epsilon)
-    U_V_LS = np.zeros((h, w, 2))
-    U_V_LS[valid_indices[0] + window_size // 2, valid_indices[1] + window_size // 2] = np.linalg.solve(ATA[valid_indices], b[valid_indices])
-    du, dv = U_V_LS[:, :, 0], U_V_LS[:, :, 1]
+    b_1 = np.sum(Ixt_windows, axis=(2, 3))
+    b_2 = np.sum(Iyt_windows, axis=(2, 3))
+
+    # Calculate U_V_LS with the closed-form 2x2 inverse instead of a batched
+    # np.linalg.solve: no explicit inverse, no per-pixel LAPACK dispatch.
+    det = ATA_11 * ATA_22 - ATA_12 * ATA_12
+    valid = det > epsilon
+    det_safe = np.where(valid, det, 1.0)
+    half = window_size // 2
+    du[half:half + det.shape[0], half:half + det.shape[1]] = \
+        np.where(valid, (ATA_22 * b_1 - ATA_12 * b_2) / det_safe, 0.0)
+    dv[half:half + det.shape[0], half:half + det.shape[1]] = \
+        np.where(valid, (ATA_11 * b_2 - ATA_12 * b_1) / det_safe, 0.0)
     return du, dv
 
 def lucas_kanade_optical_flow(I1: np.ndarray,
@@ -195,7 +196,9 @@ def lucas_kanade_optical_flow(I1: np.ndarray,
             du, dv = my_lucas_kanade_step(I1=pyramid_I1[level], I2=I2_warp, window_size=window_size)
             u += du
             v += dv
-            I2_warp = my_warp_image(pyarmid_I2[level], u, v)
+            # The warp of the last iteration is never read; skip it.
+            if iter < max_iter - 1:
+                I2_warp = my_warp_image(pyarmid_I2[level], u, v)
         if level > 0:
             h_scale, w_scale = pyarmid_I2[level - 1].shape
             u = cv2.resize(u, (w_scale, h_scale)) * DOWN_FACTOR
@@ -227,8 +230,8 @@ def lucas_kanade_video_stabilization(input_video_path: str,
     w_factor = int(np.ceil(gray_frame.shape[1] / (2 ** (num_levels - 1 + 1))))
     IMAGE_SIZE = (w_factor * (2 ** (num_levels - 1 + 1)), h_factor * (2 ** (num_levels - 1 + 1)))
     gray_frame = cv2.resize(gray_frame, IMAGE_SIZE)
-    u = np.zeros(gray_frame.shape, dtype=np.float)
-    v = np.zeros(gray_frame.shape, dtype=np.float)
+    u = np.zeros(gray_frame.shape, dtype=np.float32)
+    v = np.zeros(gray_frame.shape, dtype=np.float32)
     prev_frame = gray_frame
     while cap.isOpened():
         ret, frame = cap.read()
@@ -306,18 +309,23 @@ def faster_lucas_kanade_step(I1: np.ndarray,
     Iyt_windows_at_interest_points = Iyt_windows[y, x, :, :].reshape((len(corners), window_size, window_size, 1, 1))
 
     # Calculate ATA and b using vectorized operations
-    ATA_11 = np.sum(Ixx_windows_at_interest_points, axis=(1, 2, 3))
-    ATA_12 = np.sum(Ixy_windows_at_interest_points, axis=(1, 2, 3))
-    ATA_21 = ATA_12
-    ATA_22 = np.sum(Iyy_windows_at_interest_points, axis=(1, 2, 3))
-    ATA = np.stack([np.stack([ATA_11, ATA_12], axis=-1), np.stack([ATA_21, ATA_22], axis=-1)], axis=-2)
-    b_1 = np.sum(Ixt_windows_at_interest_points, axis=(1, 2, 3))[:, :, np.newaxis]
-    b_2 = np.sum(Iyt_windows_at_interest_points, axis=(1, 2, 3))[:, :, np.newaxis]
-    b = np.concatenate([b_1, b_2], axis=-1)
-
-    # Calculate U_V_LS using vectorized operations
+    ATA_11 = np.sum(Ixx_windows_at_interest_points, axis=(1, 2, 3)).squeeze(-1)
+    ATA_12 = np.sum(Ixy_windows_at_interest_points, axis=(1, 2, 3)).squeeze(-1)
+    ATA_22 = np.sum(Iyy_windows_at_interest_points, axis=(1, 2, 3)).squeeze(-1)
+    b_1 = np.sum(Ixt_windows_at_interest_points, axis=(1, 2, 3)).squeeze(-1)
+    b_2 = np.sum(Iyt_windows_at_interest_points, axis=(1, 2, 3)).squeeze(-1)
+
+    # Solve all the 2x2 systems at once with the closed-form inverse; a
+    # batched np.linalg.solve would dispatch LAPACK per system, while for 2x2
+    # the analytic inverse is a few elementwise ops. Corners whose system
+    # does not converge (det <= epsilon) keep (u, v) = 0.
+    epsilon = 1e-4
+    det = ATA_11 * ATA_22 - ATA_12 * ATA_12
+    valid = det > epsilon
+    det_safe = np.where(valid, det, 1.0)
     U_V_LS = np.zeros((h, w, 2))
-    U_V_LS[y, x] = np.linalg.solve(ATA, b).squeeze()
+    U_V_LS[y, x, 0] = np.where(valid, (ATA_22 * b_1 - ATA_12 * b_2) / det_safe, 0.0)
+    U_V_LS[y, x, 1] = np.where(valid, (ATA_11 * b_2 - ATA_12 * b_1) / det_safe, 0.0)
     du, dv = U_V_LS[:, :, 0], U_V_LS[:, :, 1]
     return du, dv
 
@@ -357,7 +365,9 @@ def faster_lucas_kanade_optical_flow(
             du, dv = faster_lucas_kanade_step(I1=pyramid_I1[level], I2=I2_warp, window_size=window_size)
             u += du
             v += dv
-            I2_warp = my_warp_image(pyarmid_I2[level], u, v)
+            # The warp of the last iteration is never read; skip it.
+            if iter < max_iter - 1:
+                I2_warp = my_warp_image(pyarmid_I2[level], u, v)
         if level > 0:
             h_scale, w_scale = pyarmid_I2[level - 1].shape
             u = cv2.resize(u, (w_scale, h_scale)) * DOWN_FACTOR
@@ -395,8 +405,8 @@ def lucas_kanade_faster_video_stabilization_fix_effects(
     w_factor = int(np.ceil(gray_frame.shape[1] / (2 ** (num_levels - 1 + 1))))
     IMAGE_SIZE = (w_factor * (2 ** (num_levels - 1 + 1)), h_factor * (2 ** (num_levels - 1 + 1)))
     gray_frame = cv2.resize(gray_frame, IMAGE_SIZE)
-    u = np.zeros(gray_frame.shape, dtype=np.float)
-    v = np.zeros(gray_frame.shape, dtype=np.float)
+    u = np.zeros(gray_frame.shape, dtype=np.float32)
+    v = np.zeros(gray_frame.shape, dtype=np.float32)
     prev_frame = gray_frame
     while cap.isOpened():
         ret, frame = cap.read()